@@ -4,13 +4,16 @@ from core.version import VERSION
 
 from PySide6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel,
-    QFileDialog, QTextEdit, QSpinBox, QCheckBox, QComboBox, QGroupBox
+    QFileDialog, QTextEdit, QSpinBox, QCheckBox, QComboBox, QGroupBox, QLineEdit
 )
 
 from core.pipeline import (build_master, merge_many_chunks, export_output, 
-                           compute_stats_from_master, compute_stats_from_input)
+                           compute_stats_from_master, compute_stats_from_input,
+                           is_blocked, qa_report_path)
 from core.chunking import chunk_entries, write_chunks, write_chunks_index
-from core.io_tsv import read_master_tsv
+from core.io_tsv import read_master_langs, master_languages
+from core.search import search_master, bulk_replace
+from core.pretranslate import BACKENDS, get_backend, pretranslate_chunks
 from core.settings import load_settings, save_settings, AppSettings
 
 
@@ -60,12 +63,21 @@ class App(QWidget):
         layout.addLayout(row)
 
         # Build master
+        build_row = QHBoxLayout()
         self.btn_build = QPushButton("Build master.tsv")
         self.btn_build.clicked.connect(self.on_build)
-        layout.addWidget(self.btn_build)
+        build_row.addWidget(self.btn_build, 1)
+        build_row.addWidget(QLabel("Languages:"))
+        self.txt_langs = QLineEdit(self.cfg.languages)
+        self.txt_langs.setPlaceholderText("e.g. bg,ro (empty = single translated column)")
+        build_row.addWidget(self.txt_langs)
+        layout.addLayout(build_row)
 
         # Chunk controls
         chunk_row = QHBoxLayout()
+        chunk_row.addWidget(QLabel("Language:"))
+        self.cmb_lang = QComboBox()
+        chunk_row.addWidget(self.cmb_lang)
         chunk_row.addWidget(QLabel("Chunk size:"))
         self.spin_chunk = QSpinBox()
         self.spin_chunk.setRange(100, 20000)
@@ -79,6 +91,21 @@ class App(QWidget):
         chunk_row.addWidget(self.btn_chunk)
         layout.addLayout(chunk_row)
 
+        # Machine pre-translation
+        mt_row = QHBoxLayout()
+        mt_row.addWidget(QLabel("MT backend:"))
+        self.cmb_backend = QComboBox()
+        self.cmb_backend.addItems(list(BACKENDS))
+        self.cmb_backend.setCurrentText(self.cfg.mt_backend)
+        mt_row.addWidget(self.cmb_backend)
+        self.btn_mt = QPushButton("Pre-translate chunks")
+        self.btn_mt.setToolTip(
+                "Fill empty `translated` in the selected chunk TSV files via the MT backend (~...~ tags are protected)."
+            )
+        self.btn_mt.clicked.connect(self.on_pretranslate)
+        mt_row.addWidget(self.btn_mt, 1)
+        layout.addLayout(mt_row)
+
         # Apply chunks
         self.btn_apply = QPushButton("Apply chunks to master")
         self.btn_apply.clicked.connect(self.on_apply)
@@ -98,6 +125,13 @@ class App(QWidget):
         self.chk_sanity.setChecked(self.cfg.run_sanity)
         export_row.addWidget(self.chk_sanity)
 
+        self.chk_consistency = QCheckBox("Check inconsistent translations")
+        self.chk_consistency.setToolTip(
+                "Report identical source strings with different translations (05_reports/inconsistent_translations.tsv)."
+            )
+        self.chk_consistency.setChecked(self.cfg.check_consistency)
+        export_row.addWidget(self.chk_consistency)
+
         self.chk_partial = QCheckBox("Export only affected files (from selected chunks)")
         self.chk_partial.setToolTip(
                 "If enabled, only files referenced by the selected chunk TSV files will be exported."
@@ -110,12 +144,33 @@ class App(QWidget):
 
         layout.addLayout(export_row)
 
+        # Search / bulk replace
+        search_row = QHBoxLayout()
+        self.txt_find = QLineEdit()
+        self.txt_find.setPlaceholderText("Find (source + translated)")
+        search_row.addWidget(self.txt_find, 1)
+        self.txt_repl = QLineEdit()
+        self.txt_repl.setPlaceholderText("Replace with (translated only, ~...~ tags untouched)")
+        search_row.addWidget(self.txt_repl, 1)
+        self.chk_regex = QCheckBox("Regex")
+        search_row.addWidget(self.chk_regex)
+        self.chk_case = QCheckBox("Match case")
+        search_row.addWidget(self.chk_case)
+        self.btn_find = QPushButton("Find")
+        self.btn_find.clicked.connect(self.on_find)
+        search_row.addWidget(self.btn_find)
+        self.btn_replace = QPushButton("Replace all")
+        self.btn_replace.clicked.connect(self.on_replace)
+        search_row.addWidget(self.btn_replace)
+        layout.addLayout(search_row)
+
 
         # Log
         self.log = QTextEdit()
         self.log.setReadOnly(True)
         layout.addWidget(self.log, 1)
 
+        self._refresh_langs()
         self._log("Ready.")
     
     def _save_cfg(self):
@@ -126,9 +181,26 @@ class App(QWidget):
         self.cfg.chunk_size = int(self.spin_chunk.value())
         self.cfg.separate_global = bool(self.chk_global.isChecked())
         self.cfg.run_sanity = bool(self.chk_sanity.isChecked())
+        self.cfg.check_consistency = bool(self.chk_consistency.isChecked())
         self.cfg.norm_mode = str(self.cmb_norm.currentText())
+        self.cfg.languages = self.txt_langs.text().strip()
+        self.cfg.mt_backend = str(self.cmb_backend.currentText())
         save_settings(self.cfg)
 
+    def _refresh_langs(self):
+        # езиците идват от header-а на master.tsv
+        self.cmb_lang.clear()
+        langs = master_languages(self.master_path) if self.master_path.exists() else [""]
+        for lang in langs:
+            self.cmb_lang.addItem(lang or "(single)", lang)
+
+    def _lang(self) -> str:
+        return self.cmb_lang.currentData() or ""
+
+    def _lang_chunks_dir(self) -> Path:
+        lang = self._lang()
+        return self.chunks_dir / lang if lang else self.chunks_dir
+
     def _log(self, msg: str) -> None:
         self.log.append(msg)
 
@@ -151,6 +223,8 @@ class App(QWidget):
             if self.master_path.exists():
                 lines.append(f"Translated: {st.translated}")
                 lines.append(f"Untranslated (todo): {st.todo}")
+                for lang, n in st.languages:
+                    lines.append(f"  [{lang}] translated: {n}")
 
             if st.flags_top:
                 lines.append("")
@@ -159,6 +233,7 @@ class App(QWidget):
                     lines.append(f"  {k}: {v}")
 
             self.txt_stats.setPlainText("\n".join(lines))
+            self._refresh_langs()
             self._log("Scan complete.")
             self._save_cfg()
 
@@ -174,48 +249,134 @@ class App(QWidget):
 
 
     def on_build(self):
-        n_entries, n_ignored = build_master(self.input_dir, self.master_path)
+        langs = [x.strip() for x in self.txt_langs.text().split(",") if x.strip()]
+        n_entries, n_ignored = build_master(self.input_dir, self.master_path, languages=langs or None)
         self._log(f"Built master: {n_entries} entries. Ignored files: {n_ignored}.")
+        if langs:
+            self._log(f"Languages: {', '.join(langs)}")
         self._log(f"Master path: {self.master_path}")
+        self._refresh_langs()
         self._save_cfg()
 
 
     def on_chunk(self):
-        entries = read_master_tsv(self.master_path)
+        entries = read_master_langs(self.master_path)[self._lang()]
         chunks = chunk_entries(entries, self.spin_chunk.value(), separate_global=self.chk_global.isChecked())
-        paths = write_chunks(self.chunks_dir, chunks)
+        out_dir = self._lang_chunks_dir()
+        paths = write_chunks(out_dir, chunks)
 
-        index_path = self.chunks_dir / "chunks_index.tsv"
-        write_chunks_index(self.chunks_dir, index_path)
+        index_path = out_dir / "chunks_index.tsv"
+        write_chunks_index(out_dir, index_path)
 
-        self._log(f"Chunks created: {len(paths)} in {self.chunks_dir}")
+        self._log(f"Chunks created: {len(paths)} in {out_dir}")
         self._log(f"Chunks index written: {index_path}")
         self._save_cfg()
 
+    def on_pretranslate(self):
+        files, _ = QFileDialog.getOpenFileNames(
+            self,
+            "Select chunk TSV files to pre-translate",
+            str(self._lang_chunks_dir()),
+            "TSV Files (*.tsv)"
+        )
+        if not files:
+            return
+
+        # при master с една колона translated целевият език идва от settings
+        target_lang = self._lang() or self.cfg.target_lang
+        try:
+            st = pretranslate_chunks(
+                [Path(f) for f in files],
+                get_backend(self.cmb_backend.currentText()),
+                target_lang,
+                cache_dir=self.chunks_dir,
+                batch_size=self.cfg.mt_batch_size,
+                concurrency=self.cfg.mt_concurrency
+            )
+        except Exception as e:
+            self._log(f"Pre-translation failed: {e}")
+            return
+
+        self._log(f"Pre-translated [{target_lang}]: {st.translated} of {st.rows} empty rows "
+                  f"(cached: {st.cached}, sent: {st.sent}, requests: {st.requests}, failed: {st.failed}).")
+        if st.errors:
+            self._log(f"Backend errors in {len(st.errors)} batch(es):")
+            for err in st.errors[:5]:
+                self._log(f"  {err}")
+        self._save_cfg()
+
     def on_apply(self):
         files, _ = QFileDialog.getOpenFileNames(
             self,
             "Select chunk TSV files",
-            str(self.chunks_dir),
+            str(self._lang_chunks_dir()),
             "TSV Files (*.tsv)"
         )
         if not files:
             return
 
-        updated, total, backup_path = merge_many_chunks(
+        conflicts_path = Path("05_reports") / "merge_conflicts.tsv"
+        updated, total, backup_path, conflicts = merge_many_chunks(
             self.master_path,
             [Path(f) for f in files],
-            backup_dir=Path("02_master")  # backup-ите да стоят до мастъра
+            backup_dir=Path("02_master"),  # backup-ите да стоят до мастъра
+            conflicts_report=conflicts_path,
+            lang=self._lang()
         )
 
         self._log(f"Applied chunks: updated {updated} rows out of {total} chunk rows.")
+        if conflicts:
+            self._log(f"Conflicts (master changed since chunking): {len(conflicts)} rows skipped. See {conflicts_path}")
+            for it in conflicts[:10]:
+                self._log(f"{it.issue_type}: {it.file} {it.key} - {it.details}")
         if backup_path:
             self._log(f"Backup created: {backup_path}")
-        self._log(f"Master updated in-place: {self.master_path}")
+        if updated:
+            self._log(f"Master updated in-place: {self.master_path}")
 
         self._save_cfg()
 
 
+    def on_find(self):
+        query = self.txt_find.text()
+        if not query:
+            return
+        try:
+            hits = search_master(self.master_path, query,
+                                 regex=self.chk_regex.isChecked(),
+                                 case_sensitive=self.chk_case.isChecked(),
+                                 lang=self._lang())
+        except Exception as e:
+            self._log(f"Search failed: {e}")
+            return
+
+        self._log(f"Found {len(hits)} match(es) for: {query}")
+        # показваме само първите 50
+        for h in hits[:50]:
+            self._log(f"[{h.field}] {h.file} {h.key}: {h.text}")
+
+    def on_replace(self):
+        query = self.txt_find.text()
+        if not query:
+            return
+        try:
+            rows, total, backup_path = bulk_replace(
+                self.master_path,
+                query,
+                self.txt_repl.text(),
+                regex=self.chk_regex.isChecked(),
+                case_sensitive=self.chk_case.isChecked(),
+                backup_dir=Path("02_master"),
+                lang=self._lang()
+            )
+        except Exception as e:
+            self._log(f"Replace failed: {e}")
+            return
+
+        self._log(f"Replaced {total} occurrence(s) in {rows} row(s).")
+        if backup_path:
+            self._log(f"Backup created: {backup_path}")
+
     def on_export(self):
         # 1) Избор на output папка
         d = QFileDialog.getExistingDirectory(
@@ -237,7 +398,7 @@ class App(QWidget):
             files, _ = QFileDialog.getOpenFileNames(
                 self,
                 "Select chunk TSV files (for affected-only export)",
-                str(self.chunks_dir),
+                str(self._lang_chunks_dir()),
                 "TSV Files (*.tsv)"
             )
             if not files:
@@ -246,35 +407,39 @@ class App(QWidget):
             affected = [Path(f) for f in files]
             self._log(f"Partial export enabled: using {len(affected)} chunk file(s) to determine affected files.")
 
-        # 4) Реален export
-        written, issues = export_output(
+        # 4) Реален export (всички езици от master)
+        results = export_output(
             self.master_path,
             self.output_dir,
             normalization_mode=norm,
             use_crlf=True,
             run_sanity=self.chk_sanity.isChecked(),
-            affected_only_from_chunks=affected
+            affected_only_from_chunks=affected,
+            glossary_path=Path(self.cfg.glossary_path),
+            check_consistency=self.chk_consistency.isChecked()
         )
 
-        # 5) Ако export е блокиран от QA (critical) – казваме ясно и спираме
-        if written == 0 and issues and self.chk_sanity.isChecked():
-            self._log("Export blocked due to critical QA issues. See 05_reports/qa_report.tsv")
-            # показваме само първите 10
-            for it in issues[:10]:
-                self._log(f"{it.issue_type}: {it.file} {it.key} - {it.details}")
-            self._save_cfg()
-            return
+        for lang, (written, issues) in results.items():
+            label = f"[{lang}] " if lang else ""
+            out_dir = self.output_dir / lang if lang else self.output_dir
 
-        # 6) Лог за нормален export
-        self._log(f"Exported files: {written} to {self.output_dir}")
+            # 5) Ако export е блокиран от QA (critical) – казваме ясно за всеки език
+            if self.chk_sanity.isChecked() and is_blocked(issues):
+                self._log(f"{label}Export blocked due to critical QA issues. See {qa_report_path(lang)}")
+                # показваме само първите 10
+                for it in issues[:10]:
+                    self._log(f"{label}{it.issue_type}: {it.file} {it.key} - {it.details}")
+                continue
 
-        if issues:
-            self._log(f"Sanity issues: {len(issues)} (QA report generated)")
-            for it in issues[:10]:
-                self._log(f"{it.issue_type}: {it.file} {it.key} - {it.details}")
+            # 6) Лог за нормален export
+            self._log(f"{label}Exported files: {written} to {out_dir}")
 
-        self._save_cfg()
+            if issues:
+                self._log(f"{label}Sanity issues: {len(issues)} (QA report generated: {qa_report_path(lang)})")
+                for it in issues[:10]:
+                    self._log(f"{label}{it.issue_type}: {it.file} {it.key} - {it.details}")
 
+        self._save_cfg()
 
 
 if __name__ == "__main__":
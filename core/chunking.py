@@ -1,7 +1,7 @@
 from __future__ import annotations
 from pathlib import Path
 from .io_txt import Entry
-from .io_tsv import write_master_tsv
+from .io_tsv import write_chunk_tsv, entry_hash
 from collections import Counter
 import csv
 from .io_tsv import read_master_tsv
@@ -66,6 +66,8 @@ def write_chunks(out_dir: Path, chunks: list[list[Entry]]) -> list[Path]:
     paths: list[Path] = []
     for idx, ch in enumerate(chunks, start=1):
         p = out_dir / f"chunk_{idx:04d}.tsv"
-        write_master_tsv(p, ch)
+        for e in ch:
+            e.base_hash = entry_hash(e)
+        write_chunk_tsv(p, ch)
         paths.append(p)
     return paths
@@ -0,0 +1,146 @@
+from __future__ import annotations
+from pathlib import Path
+from dataclasses import dataclass
+from collections import deque
+import csv
+
+from .io_txt import Entry
+from .qa import QaIssue, TAG_BLOCK_RE
+
+
+@dataclass
+class GlossaryTerm:
+    source: str
+    targets: list[str]  # допустими варианти (напр. членувани форми)
+
+
+def merge_terms(terms: list[GlossaryTerm]) -> list[GlossaryTerm]:
+    # автоматът е case-insensitive: "Arthur" и "arthur" са един термин с общи target-и
+    merged: dict[str, GlossaryTerm] = {}
+    for t in terms:
+        m = merged.get(_fold_case(t.source))
+        if m is None:
+            merged[_fold_case(t.source)] = GlossaryTerm(t.source, list(t.targets))
+            continue
+        m.targets.extend(x for x in t.targets if x not in m.targets)
+    return list(merged.values())
+
+
+def read_glossary(path: Path) -> list[GlossaryTerm]:
+    # TSV: source | target ; вариантите в target са разделени с '|'
+    terms: list[GlossaryTerm] = []
+    with path.open("r", encoding="utf-8", newline="") as f:
+        r = csv.DictReader(f, delimiter="\t")
+        for row in r:
+            src = (row.get("source") or "").strip()
+            targets = [t.strip() for t in (row.get("target") or "").split("|") if t.strip()]
+            if src and targets:
+                terms.append(GlossaryTerm(src, targets))
+    return merge_terms(terms)
+
+
+def _fold_case(text: str) -> str:
+    # lower() по символ, без да се променя дължината ('İ'.lower() е 2 code point-а),
+    # за да съвпадат offset-ите с оригиналния текст
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(lo if len(lo := ch.lower()) == 1 else ch for ch in text)
+
+
+class TermAutomaton:
+    """Aho-Corasick automaton over lowercased source terms; one pass per text."""
+
+    def __init__(self, terms: list[str]):
+        self.terms = [_fold_case(t) for t in terms]
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.out: list[list[int]] = [[]]
+
+        for tid, term in enumerate(self.terms):
+            node = 0
+            for ch in term:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = nxt
+            self.out[node].append(tid)
+
+        # BFS: fail линкове + наследяване на изходите
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def find(self, text: str) -> list[tuple[int, int, int]]:
+        """All (start, end, term_id) matches in `text`, overlapping included."""
+        s = _fold_case(text)
+        hits: list[tuple[int, int, int]] = []
+        node = 0
+        for i, ch in enumerate(s):
+            while node and ch not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(ch, 0)
+            for tid in self.out[node]:
+                hits.append((i + 1 - len(self.terms[tid]), i + 1, tid))
+        return hits
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+def match_terms(automaton: TermAutomaton, text: str) -> list[int]:
+    """Leftmost-longest, whole-word term matches (term ids) in `text`, outside `~...~` tags."""
+    tags = [m.span() for m in TAG_BLOCK_RE.finditer(text)]
+    hits = []
+    for start, end, tid in automaton.find(text):
+        if any(start < te and end > ts for ts, te in tags):
+            continue
+        if start > 0 and _is_word_char(text[start - 1]) and _is_word_char(text[start]):
+            continue
+        if end < len(text) and _is_word_char(text[end]) and _is_word_char(text[end - 1]):
+            continue
+        hits.append((start, end, tid))
+
+    # "Saint Denis" печели пред "Denis" в същия участък
+    hits.sort(key=lambda h: (h[0], -(h[1] - h[0])))
+    result: list[int] = []
+    pos = 0
+    for start, end, tid in hits:
+        if start < pos:
+            continue
+        result.append(tid)
+        pos = end
+    return result
+
+
+def run_glossary_qa(entries: list[Entry], terms: list[GlossaryTerm]) -> list[QaIssue]:
+    issues: list[QaIssue] = []
+    if not terms:
+        return issues
+    terms = merge_terms(terms)
+    automaton = TermAutomaton([t.source for t in terms])
+    for e in entries:
+        # непреведените редове не ги броим тук
+        if not e.translated.strip():
+            continue
+        tgt = None
+        for tid in dict.fromkeys(match_terms(automaton, e.source)):
+            term = terms[tid]
+            if tgt is None:
+                tgt = e.translated.lower()
+            if not any(t.lower() in tgt for t in term.targets):
+                issues.append(QaIssue(e.file, e.key, "glossary_mismatch",
+                                      f"'{term.source}' -> expected '{' | '.join(term.targets)}'"))
+    return issues
@@ -2,10 +2,20 @@ from __future__ import annotations
 from pathlib import Path
 from typing import Iterable
 import csv
+import hashlib
 
 from .io_txt import Entry
 
 HEADER = ["file", "key", "source", "translated", "note", "flags"]
+CHUNK_HEADER = HEADER + ["base_hash"]
+
+def row_hash(source: str, translated: str, note: str, flags: str) -> str:
+    # 0x1f (unit separator) не се среща в RDR2 текстовете
+    data = "\x1f".join((source, translated, note, flags)).encode("utf-8")
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+def entry_hash(e: Entry) -> str:
+    return row_hash(e.source, e.translated, e.note, e.flags)
 
 def write_master_tsv(path: Path, entries: Iterable[Entry]) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
@@ -15,6 +25,15 @@ def write_master_tsv(path: Path, entries: Iterable[Entry]) -> None:
         for e in entries:
             w.writerow([e.file, e.key, e.source, e.translated, e.note, e.flags])
 
+def write_chunk_tsv(path: Path, entries: Iterable[Entry]) -> None:
+    # като master, плюс base_hash; редове без hash (стари chunk-ове) остават празни
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f, delimiter="\t", lineterminator="\n")
+        w.writerow(CHUNK_HEADER)
+        for e in entries:
+            w.writerow([e.file, e.key, e.source, e.translated, e.note, e.flags, e.base_hash])
+
 def read_master_tsv(path: Path) -> list[Entry]:
     with path.open("r", encoding="utf-8", newline="") as f:
         r = csv.DictReader(f, delimiter="\t")
@@ -27,6 +46,70 @@ def read_master_tsv(path: Path) -> list[Entry]:
                 translated=row.get("translated",""),
                 note=row.get("note",""),
                 flags=row.get("flags",""),
-                idx=idx
+                idx=idx,
+                base_hash=row.get("base_hash") or ""
             ))
         return entries
+
+# Multi-language master: file | key | source | translated_<lang> | note_<lang> | flags_<lang> | ...
+# Езикът "" означава стария master с една колона `translated`.
+SHARED_HEADER = ["file", "key", "source"]
+
+def work_columns(lang: str) -> list[str]:
+    if not lang:
+        return ["translated", "note", "flags"]
+    return [f"translated_{lang}", f"note_{lang}", f"flags_{lang}"]
+
+def languages_from_header(header: list[str]) -> list[str]:
+    langs = [c[len("translated_"):] for c in header if c.startswith("translated_")]
+    return langs or [""]
+
+def master_languages(path: Path) -> list[str]:
+    with path.open("r", encoding="utf-8", newline="") as f:
+        header = next(csv.reader(f, delimiter="\t"), [])
+    return languages_from_header(header)
+
+def read_master_langs(path: Path) -> dict[str, list[Entry]]:
+    """One parse of the master -> per-language Entry lists (same row order, shared source)."""
+    with path.open("r", encoding="utf-8", newline="") as f:
+        r = csv.reader(f, delimiter="\t")
+        header = next(r, [])
+        pos = {c: i for i, c in enumerate(header)}
+        langs = languages_from_header(header)
+        cols = {lang: [pos.get(c) for c in work_columns(lang)] for lang in langs}
+        i_file, i_key, i_src = (pos.get(c) for c in SHARED_HEADER)
+
+        def cell(row: list[str], i: int | None) -> str:
+            return row[i] if i is not None and i < len(row) else ""
+
+        by_lang: dict[str, list[Entry]] = {lang: [] for lang in langs}
+        for idx, row in enumerate(r):
+            file, key, source = cell(row, i_file), cell(row, i_key), cell(row, i_src)
+            for lang in langs:
+                i_tr, i_note, i_flags = cols[lang]
+                by_lang[lang].append(Entry(
+                    file=file,
+                    key=key,
+                    source=source,
+                    translated=cell(row, i_tr),
+                    note=cell(row, i_note),
+                    flags=cell(row, i_flags),
+                    idx=idx
+                ))
+        return by_lang
+
+def write_master_langs(path: Path, by_lang: dict[str, list[Entry]]) -> None:
+    langs = list(by_lang)
+    if langs == [""]:
+        write_master_tsv(path, by_lang[""])
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f, delimiter="\t", lineterminator="\n")
+        w.writerow(SHARED_HEADER + [c for lang in langs for c in work_columns(lang)])
+        for rows in zip(*(by_lang[lang] for lang in langs)):
+            base = rows[0]
+            out = [base.file, base.key, base.source]
+            for e in rows:
+                out.extend([e.translated, e.note, e.flags])
+            w.writerow(out)
@@ -16,6 +16,7 @@ class Entry:
     note: str = ""
     flags: str = "todo"
     idx: int = 0  # вътрешно; не пишем в TSV, но помага
+    base_hash: str = ""  # само в chunk TSV: hash на master реда към момента на чънкване
 
 def is_text_kv_line(line: str) -> bool:
     return KEY_RE.match(line) is not None
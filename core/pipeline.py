@@ -3,13 +3,17 @@ from pathlib import Path
 from collections import defaultdict, Counter
 import shutil
 from datetime import datetime
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
 
 
 from .io_txt import Entry, scan_input_folder, write_txt_file
-from .io_tsv import write_master_tsv, read_master_tsv
+from .io_tsv import (write_master_tsv, read_master_tsv, row_hash, entry_hash,
+                     read_master_langs, write_master_langs, write_chunk_tsv)
 from .normalize import normalize_text, OFF, SAFE, STRICT
-from .qa import run_qa, QaIssue, run_qa, write_qa_report
+from .qa import (run_qa, QaIssue, run_qa, write_qa_report,
+                 find_inconsistent_translations, write_inconsistency_report)
+from .search import refresh_index
+from .glossary import read_glossary, run_glossary_qa
 
 @dataclass
 class Stats:
@@ -20,9 +24,12 @@ class Stats:
     unique_files: int
     flags_top: list[tuple[str, int]]
     source_hint: str  # "input folder" или "master.tsv"
+    languages: list[tuple[str, int]] = field(default_factory=list)  # (lang, translated) за multi-language master
 
 def compute_stats_from_master(master_path: Path) -> Stats:
-    entries = read_master_tsv(master_path)
+    by_lang = read_master_langs(master_path)
+    # общите числа са за първия език; останалите са в `languages`
+    entries = next(iter(by_lang.values()))
     files = len(set(e.file for e in entries if e.file))
     total = len(entries)
     translated = sum(1 for e in entries if e.translated.strip())
@@ -39,7 +46,9 @@ def compute_stats_from_master(master_path: Path) -> Stats:
         todo=todo,
         unique_files=files,
         flags_top=flags_top,
-        source_hint=f"master: {master_path}"
+        source_hint=f"master: {master_path}",
+        languages=[(lang, sum(1 for e in rows if e.translated.strip()))
+                   for lang, rows in by_lang.items() if lang]
     )
 
 def compute_stats_from_input(input_dir: Path) -> Stats:
@@ -58,13 +67,33 @@ def compute_stats_from_input(input_dir: Path) -> Stats:
         source_hint=f"input: {input_dir}"
     )
 
-def build_master(input_dir: Path, master_path: Path) -> tuple[int, int]:
+def build_master(input_dir: Path, master_path: Path, languages: list[str] | None = None) -> tuple[int, int]:
     entries, ignored = scan_input_folder(input_dir)
     # ignored txt files report-ване ще добавим в UI
-    write_master_tsv(master_path, entries)
+    if languages:
+        # един общ source + work колони за всеки език
+        write_master_langs(master_path, {lang: [replace(e) for e in entries] for lang in languages})
+    else:
+        write_master_tsv(master_path, entries)
     return len(entries), len(ignored)
 
 
+def add_languages(master_path: Path, languages: list[str]) -> list[str]:
+    """Add work columns for new languages; a single-language master's work moves to languages[0]."""
+    by_lang = read_master_langs(master_path)
+    if list(by_lang) == [""]:
+        by_lang = {languages[0]: by_lang[""]}
+    base = next(iter(by_lang.values()))
+    added = []
+    for lang in languages:
+        if lang in by_lang:
+            continue
+        by_lang[lang] = [replace(e, translated="", note="", flags="todo") for e in base]
+        added.append(lang)
+    write_master_langs(master_path, by_lang)
+    return added
+
+
 def backup_file(path: Path, backup_dir: Path) -> Path | None:
     if not path.exists():
         return None
@@ -75,56 +104,133 @@ def backup_file(path: Path, backup_dir: Path) -> Path | None:
     return dst
 
 
-def apply_chunks_to_master(master_entries: list[Entry], chunk_entries: list[Entry]) -> tuple[list[Entry], int]:
+def apply_chunks_to_master(master_entries: list[Entry], chunk_entries: list[Entry]) -> tuple[list[Entry], int, list[QaIssue]]:
     # index master by (file,key)
     index: dict[tuple[str, str], Entry] = {
         (e.file, e.key): e for e in master_entries}
     updated = 0
+    conflicts: list[QaIssue] = []
     for c in chunk_entries:
         k = (c.file, c.key)
-        if k in index:
-            m = index[k]
-            # пренасяме само work полетата
-            m.translated = c.translated
-            m.note = c.note
-            m.flags = c.flags
-            updated += 1
-    return list(index.values()), updated
+        if k not in index:
+            continue
+        m = index[k]
+        if (m.translated, m.note, m.flags) == (c.translated, c.note, c.flags):
+            # нищо за пренасяне
+            continue
+
+        if c.base_hash:
+            chunk_hash = row_hash(m.source, c.translated, c.note, c.flags)
+            if chunk_hash == c.base_hash:
+                # редът не е пипан в chunk-а -> не презаписваме по-нова работа в master
+                continue
+            master_hash = entry_hash(m)
+            if master_hash != c.base_hash:
+                # и master, и chunk са променени след чънкването
+                conflicts.append(QaIssue(c.file, c.key, "merge_conflict",
+                                         f"master changed since chunking (base={c.base_hash} master={master_hash})"))
+                continue
+
+        # пренасяме само work полетата
+        m.translated = c.translated
+        m.note = c.note
+        m.flags = c.flags
+        updated += 1
+    return list(index.values()), updated, conflicts
+
+
+def rebase_chunk(master_entries: list[Entry], chunk_entries: list[Entry]) -> int:
+    """Move base_hash forward for chunk rows that now equal master; returns rows rebased.
+
+    Rows still differing from master (conflicts, or untouched rows where master moved on)
+    keep their old base_hash, so a later apply cannot overwrite newer master work.
+    """
+    index = {(e.file, e.key): e for e in master_entries}
+    rebased = 0
+    for c in chunk_entries:
+        m = index.get((c.file, c.key))
+        if m is None or (m.translated, m.note, m.flags) != (c.translated, c.note, c.flags):
+            continue
+        h = entry_hash(m)
+        if c.base_hash != h:
+            c.base_hash = h
+            rebased += 1
+    return rebased
 
 
-def merge_many_chunks(master_path: Path, chunk_paths: list[Path], backup_dir: Path | None = None) -> tuple[int, int, Path | None]:
-    master = read_master_tsv(master_path)
+def merge_many_chunks(master_path: Path, chunk_paths: list[Path], backup_dir: Path | None = None,
+                      conflicts_report: Path | None = None,
+                      lang: str = "") -> tuple[int, int, Path | None, list[QaIssue]]:
+    by_lang = read_master_langs(master_path)
+    if lang not in by_lang:
+        raise ValueError(f"language '{lang}' not in master: {', '.join(by_lang)}")
+    master = by_lang[lang]
 
     total_updated = 0
     total_rows = 0
+    conflicts: list[QaIssue] = []
+    loaded: list[tuple[Path, list[Entry]]] = []
     for cp in chunk_paths:
         ch = read_master_tsv(cp)
+        loaded.append((cp, ch))
         total_rows += len(ch)
-        master, upd = apply_chunks_to_master(master, ch)
+        # work полетата се сменят in-place; редът на master остава подравнен между езиците
+        _, upd, conf = apply_chunks_to_master(master, ch)
         total_updated += upd
+        conflicts.extend(conf)
+
+    if conflicts_report is not None:
+        write_qa_report(conflicts_report, conflicts)
 
     backup_path = None
-    if backup_dir is not None:
-        backup_path = backup_file(master_path, backup_dir)
+    if total_updated:
+        if backup_dir is not None:
+            backup_path = backup_file(master_path, backup_dir)
 
-    # Презаписваме master.tsv (една истина, без двойни файлове)
-    write_master_tsv(master_path, master)
-    return total_updated, total_rows, backup_path
+        # Презаписваме master.tsv (една истина, без двойни файлове)
+        write_master_langs(master_path, by_lang)
+        # trigram индексът (ако има) се обновява само за променените редове, за всички езици
+        refresh_index(master_path)
+    # иначе master остава непокътнат (без backup и презапис)
 
+    # приложените редове получават новия base_hash -> chunk-ът може да се редактира и прилага пак
+    for cp, ch in loaded:
+        if rebase_chunk(master, ch):
+            write_chunk_tsv(cp, ch)
+    return total_updated, total_rows, backup_path, conflicts
 
-def export_output(master_path: Path, output_dir: Path, normalization_mode: str = SAFE,
-                  use_crlf: bool = True, run_sanity: bool = True,
-                  affected_only_from_chunks: list[Path] | None = None) -> tuple[int, list[QaIssue]]:
-    entries = read_master_tsv(master_path)
 
-    # optional: ограничаваме до засегнати файлове от chunk-ове
-    affected_files: set[str] | None = None
-    if affected_only_from_chunks:
-        affected_files = set()
-        for cp in affected_only_from_chunks:
-            for e in read_master_tsv(cp):
-                affected_files.add(e.file)
+CRITICAL = {"tag_mismatch", "placeholder_mismatch", "sl_mismatch"}
+
+
+def is_blocked(issues: list[QaIssue]) -> bool:
+    return any(it.issue_type in CRITICAL for it in issues)
 
+
+def qa_report_path(lang: str = "") -> Path:
+    # 05_reports/qa_report.tsv или qa_report_<lang>.tsv за multi-language master
+    return Path("05_reports") / (f"qa_report_{lang}.tsv" if lang else "qa_report.tsv")
+
+
+def consistency_report_path(lang: str = "") -> Path:
+    name = f"inconsistent_translations_{lang}.tsv" if lang else "inconsistent_translations.tsv"
+    return Path("05_reports") / name
+
+
+def language_glossary(glossary_path: Path, lang: str) -> Path:
+    # glossary.tsv -> glossary_<lang>.tsv за multi-language master
+    if not lang:
+        return glossary_path
+    return glossary_path.with_name(f"{glossary_path.stem}_{lang}{glossary_path.suffix}")
+
+
+def export_language(entries: list[Entry], output_dir: Path, normalization_mode: str = SAFE,
+                    use_crlf: bool = True, run_sanity: bool = True,
+                    affected_files: set[str] | None = None,
+                    glossary_path: Path | None = None,
+                    report_path: Path = qa_report_path(),
+                    check_consistency: bool = False,
+                    consistency_path: Path = consistency_report_path()) -> tuple[int, list[QaIssue]]:
     # normalize
     for e in entries:
         if e.translated.strip():
@@ -134,13 +240,20 @@ def export_output(master_path: Path, output_dir: Path, normalization_mode: str =
     issues = []
     if run_sanity:
         issues = run_qa(entries)
+        if glossary_path is not None and glossary_path.exists():
+            issues.extend(run_glossary_qa(entries, read_glossary(glossary_path)))
+        if check_consistency:
+            groups = find_inconsistent_translations(entries)
+            write_inconsistency_report(consistency_path, groups)
+            for g in groups:
+                # по един ред на група в qa_report; детайлите са в отделния report
+                file, key = g.variants[0].example_keys[0]
+                issues.append(QaIssue(file, key, "inconsistent_translation",
+                                      f"{len(g.variants)} variants in {g.rows} rows, see {consistency_path.name}"))
         # при критични проблеми може да блокираме export; засега връщаме issues и UI решава
-        write_qa_report(Path("05_reports") / "qa_report.tsv", issues)
-
-    CRITICAL = {"tag_mismatch", "placeholder_mismatch", "sl_mismatch"}
+        write_qa_report(report_path, issues)
 
-    critical_issues = [it for it in issues if it.issue_type in CRITICAL]
-    if run_sanity and critical_issues:
+    if run_sanity and is_blocked(issues):
         # Не експортираме нищо, само report-а
         return 0, issues
 
@@ -161,3 +274,41 @@ def export_output(master_path: Path, output_dir: Path, normalization_mode: str =
         written += 1
 
     return written, issues
+
+
+def export_output(master_path: Path, output_dir: Path, normalization_mode: str = SAFE,
+                  use_crlf: bool = True, run_sanity: bool = True,
+                  affected_only_from_chunks: list[Path] | None = None,
+                  glossary_path: Path | None = None,
+                  check_consistency: bool = False) -> dict[str, tuple[int, list[QaIssue]]]:
+    """Export every language of the master; returns {lang: (files written, issues)}.
+
+    A language with critical QA issues writes nothing (only its qa_report); the
+    single-column master is returned under the key "".
+    """
+    # един parse на master-а за всички езици
+    by_lang = read_master_langs(master_path)
+
+    # optional: ограничаваме до засегнати файлове от chunk-ове
+    affected_files: set[str] | None = None
+    if affected_only_from_chunks:
+        affected_files = set()
+        for cp in affected_only_from_chunks:
+            for e in read_master_tsv(cp):
+                affected_files.add(e.file)
+
+    if list(by_lang) == [""]:
+        return {"": export_language(by_lang[""], output_dir, normalization_mode, use_crlf, run_sanity,
+                                    affected_files, glossary_path, check_consistency=check_consistency)}
+
+    # multi-language: output_dir/<lang>/ и 05_reports/qa_report_<lang>.tsv, езиците последователно
+    # (master-ът се parse-ва веднъж; export-ът е CPU-bound и нишки не помагат заради GIL)
+    return {
+        lang: export_language(rows, output_dir / lang, normalization_mode, use_crlf, run_sanity,
+                              affected_files,
+                              language_glossary(glossary_path, lang) if glossary_path is not None else None,
+                              qa_report_path(lang),
+                              check_consistency,
+                              consistency_report_path(lang))
+        for lang, rows in by_lang.items()
+    }
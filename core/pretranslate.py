@@ -0,0 +1,247 @@
+from __future__ import annotations
+from pathlib import Path
+from dataclasses import dataclass, field
+from abc import ABC, abstractmethod
+import asyncio
+import json
+import re
+import time
+
+from .io_txt import Entry
+from .io_tsv import read_master_tsv, write_chunk_tsv
+from .qa import TAG_BLOCK_RE
+
+MT_FLAG = "mt"
+
+# маркер, който MT/LLM backend-ите оставят непокътнат
+MASK_FMT = "[[T{}]]"
+MASK_RE = re.compile(r"\[\[T(\d+)\]\]")
+
+
+def mask_tags(text: str) -> tuple[str, list[str]]:
+    tags: list[str] = []
+
+    def sub(m: re.Match[str]) -> str:
+        tags.append(m.group(0))
+        return MASK_FMT.format(len(tags) - 1)
+
+    return TAG_BLOCK_RE.sub(sub, text), tags
+
+
+def unmask_tags(text: str, tags: list[str]) -> str | None:
+    """Put the `~...~` blocks back; None if the backend lost or invented a marker."""
+    found = [int(n) for n in MASK_RE.findall(text)]
+    if sorted(found) != list(range(len(tags))):
+        return None
+    return MASK_RE.sub(lambda m: tags[int(m.group(1))], text)
+
+
+class TranslationBackend(ABC):
+    """Base for MT/LLM backends: translate a batch of masked texts into `target_lang`, same order."""
+
+    name = "base"
+
+    @abstractmethod
+    async def translate_batch(self, texts: list[str], target_lang: str) -> list[str]:
+        ...
+
+
+class StubBackend(TranslationBackend):
+    """Local backend for testing: returns the text with a `[MT:<lang>]` prefix, optional fake latency."""
+
+    name = "stub"
+
+    def __init__(self, prefix: str = "[MT:{lang}] ", delay: float = 0.0):
+        self.prefix = prefix
+        self.delay = delay
+        self.calls = 0
+
+    async def translate_batch(self, texts: list[str], target_lang: str) -> list[str]:
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        prefix = self.prefix.format(lang=target_lang)
+        return [f"{prefix}{t}" for t in texts]
+
+
+BACKENDS: dict[str, type[TranslationBackend]] = {
+    StubBackend.name: StubBackend,
+}
+
+
+def get_backend(name: str, **kwargs) -> TranslationBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"unknown translation backend: {name}")
+    return BACKENDS[name](**kwargs)
+
+
+def cache_path_for(backend: TranslationBackend, base_dir: Path, target_lang: str) -> Path:
+    # отделен cache за всеки backend + целеви език (bg превод не важи за ro)
+    return base_dir / f"mt_cache_{backend.name}_{target_lang}.jsonl"
+
+
+class TranslationCache:
+    """Persistent masked-source -> masked-translation map, one JSONL per backend and target language.
+
+    Append-only: save() writes only the entries put since the last save, so it can be
+    called after every batch without rewriting the whole file.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.data: dict[str, str] = {}
+        self._unsaved: list[tuple[str, str]] = []
+        self._broken_tail = False
+        if path.exists():
+            text = path.read_text(encoding="utf-8", errors="replace")
+            for line in text.splitlines():
+                try:
+                    src, out = json.loads(line)
+                except ValueError:
+                    # недописан ред от прекъснат run
+                    continue
+                self.data[src] = out
+            self._broken_tail = bool(text) and not text.endswith("\n")
+
+    def get(self, source: str) -> str | None:
+        return self.data.get(source)
+
+    def put(self, source: str, translated: str) -> None:
+        self.data[source] = translated
+        self._unsaved.append((source, translated))
+
+    def save(self) -> None:
+        if not self._unsaved:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8", newline="\n") as f:
+            if self._broken_tail:
+                f.write("\n")
+                self._broken_tail = False
+            for pair in self._unsaved:
+                f.write(json.dumps(pair, ensure_ascii=False) + "\n")
+        self._unsaved.clear()
+
+
+class RateLimiter:
+    """Spaces out request starts to at most `rate` per second (None = unlimited)."""
+
+    def __init__(self, rate: float | None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+                now = self._next
+            self._next = now + self.interval
+
+
+@dataclass
+class PretranslateStats:
+    rows: int = 0
+    cached: int = 0
+    sent: int = 0
+    translated: int = 0
+    failed: int = 0
+    requests: int = 0
+    errors: list[str] = field(default_factory=list)  # последната грешка на всеки неуспешен batch
+
+
+async def _translate_unique(backend: TranslationBackend, texts: list[str], target_lang: str, batch_size: int,
+                            concurrency: int, max_retries: int, rate_per_sec: float | None,
+                            stats: PretranslateStats, cache: TranslationCache) -> None:
+    sem = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rate_per_sec)
+
+    async def run_batch(batch: list[str]) -> None:
+        async with sem:
+            error = ""
+            for attempt in range(max_retries + 1):
+                await limiter.wait()
+                stats.requests += 1
+                try:
+                    out = await backend.translate_batch(batch, target_lang)
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                else:
+                    if len(out) == len(batch):
+                        for src, tr in zip(batch, out):
+                            # кешираме само отговори с валидни маркери
+                            if sorted(MASK_RE.findall(tr)) == sorted(MASK_RE.findall(src)):
+                                cache.put(src, tr)
+                        # записваме веднага: прекъснат run не губи вече платени отговори
+                        cache.save()
+                        return
+                    error = f"backend returned {len(out)} texts for a batch of {len(batch)}"
+                if attempt < max_retries:
+                    # експоненциален backoff: 0.5s, 1s, 2s...
+                    await asyncio.sleep(0.5 * (2 ** attempt))
+            stats.errors.append(error)
+
+    batches = [texts[i:i+batch_size] for i in range(0, len(texts), batch_size)]
+    await asyncio.gather(*(run_batch(b) for b in batches))
+
+
+def pretranslate_entries(entries: list[Entry], backend: TranslationBackend, cache: TranslationCache,
+                         target_lang: str, batch_size: int = 50, concurrency: int = 4, max_retries: int = 3,
+                         rate_per_sec: float | None = None, overwrite: bool = False) -> PretranslateStats:
+    """Fill empty `translated` via the backend; tags are masked and restored, results cached."""
+    stats = PretranslateStats()
+
+    todo: list[tuple[Entry, str, list[str]]] = []
+    for e in entries:
+        if not e.source.strip() or (e.translated.strip() and not overwrite):
+            continue
+        masked, tags = mask_tags(e.source)
+        todo.append((e, masked, tags))
+    stats.rows = len(todo)
+
+    # уникални текстове, които ги няма в cache-а
+    pending: list[str] = []
+    seen: set[str] = set()
+    for _, masked, _ in todo:
+        if masked in seen:
+            continue
+        seen.add(masked)
+        if cache.get(masked) is None:
+            pending.append(masked)
+    stats.cached = len(seen) - len(pending)
+    stats.sent = len(pending)
+
+    if pending:
+        asyncio.run(_translate_unique(backend, pending, target_lang, batch_size, concurrency,
+                                      max_retries, rate_per_sec, stats, cache))
+
+    for e, masked, tags in todo:
+        out = cache.get(masked)
+        if out is None:
+            stats.failed += 1
+            continue
+        restored = unmask_tags(out, tags)
+        if restored is None:
+            stats.failed += 1
+            continue
+        e.translated = restored
+        e.flags = MT_FLAG
+        stats.translated += 1
+    return stats
+
+
+def pretranslate_chunks(chunk_paths: list[Path], backend: TranslationBackend, target_lang: str,
+                        cache_dir: Path, batch_size: int = 50, concurrency: int = 4, max_retries: int = 3,
+                        rate_per_sec: float | None = None, overwrite: bool = False) -> PretranslateStats:
+    cache = TranslationCache(cache_path_for(backend, cache_dir, target_lang))
+    loaded = [(cp, read_master_tsv(cp)) for cp in chunk_paths]
+    # един общ pass през всички chunk-ове -> максимално пълни batch-ове и дедупликация
+    all_entries = [e for _, ch in loaded for e in ch]
+    stats = pretranslate_entries(all_entries, backend, cache, target_lang, batch_size, concurrency,
+                                 max_retries, rate_per_sec, overwrite)
+    for cp, ch in loaded:
+        write_chunk_tsv(cp, ch)
+    return stats
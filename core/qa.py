@@ -2,8 +2,11 @@ from __future__ import annotations
 import re
 from dataclasses import dataclass
 from .io_txt import Entry
+from .normalize import normalize_text, SAFE
 from pathlib import Path
+from typing import Iterable
 import csv
+import hashlib
 
 
 TAG_BLOCK_RE = re.compile(r"~[^~]*~")
@@ -64,3 +67,61 @@ def run_qa(entries: list[Entry]) -> list[QaIssue]:
             issues.append(QaIssue(e.file, e.key, "long_translation",
                                  f"len src={len(e.source)} tgt={len(e.translated)}"))
     return issues
+
+@dataclass
+class TranslationVariant:
+    translated: str
+    count: int
+    example_keys: list[tuple[str, str]]  # (file, key)
+
+@dataclass
+class InconsistentGroup:
+    source: str
+    rows: int
+    variants: list[TranslationVariant]
+
+def _norm_key(s: str) -> bytes:
+    # safe нормализация + сгъстени интервали; ключът на групата е 8-байтов hash
+    normed, _ = normalize_text(s, SAFE)
+    return hashlib.blake2b(" ".join(normed.split()).encode("utf-8"), digest_size=8).digest()
+
+def find_inconsistent_translations(entries: Iterable[Entry], max_examples: int = 3) -> list[InconsistentGroup]:
+    """One linear pass: group translated rows by normalised source hash, keep groups with >1 translation."""
+    # source hash -> (първи source, translation hash -> [translated, count, example keys]);
+    # за група пазим един source и по един translated на вариант, не всички редове
+    groups: dict[bytes, tuple[str, dict[bytes, list]]] = {}
+    for e in entries:
+        if not e.translated.strip():
+            continue
+        sk = _norm_key(e.source)
+        g = groups.get(sk)
+        if g is None:
+            g = groups[sk] = (e.source, {})
+        variants = g[1]
+        tk = _norm_key(e.translated)
+        v = variants.get(tk)
+        if v is None:
+            v = variants[tk] = [e.translated, 0, []]
+        v[1] += 1
+        if len(v[2]) < max_examples:
+            v[2].append((e.file, e.key))
+
+    out: list[InconsistentGroup] = []
+    for source, variants in groups.values():
+        if len(variants) < 2:
+            continue
+        vs = sorted((TranslationVariant(t, n, ex) for t, n, ex in variants.values()),
+                    key=lambda v: -v.count)
+        out.append(InconsistentGroup(source, sum(v.count for v in vs), vs))
+    out.sort(key=lambda g: -g.rows)
+    return out
+
+def write_inconsistency_report(path: Path, groups: list[InconsistentGroup]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f, delimiter="\t", lineterminator="\n")
+        w.writerow(["source", "rows", "variants", "translated", "count", "example_keys"])
+        for g in groups:
+            for v in g.variants:
+                w.writerow([g.source, g.rows, len(g.variants), v.translated, v.count,
+                        ";".join(f"{file}:{key}" for file, key in v.example_keys)])
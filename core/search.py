@@ -0,0 +1,538 @@
+from __future__ import annotations
+from pathlib import Path
+from dataclasses import dataclass
+from array import array
+from itertools import accumulate, repeat
+from operator import sub
+from typing import Iterator
+import bisect
+import csv
+import hashlib
+import itertools
+import json
+import re
+import sqlite3
+import zlib
+
+from .io_txt import Entry
+from .io_tsv import read_master_langs, write_master_langs, work_columns
+from .qa import TAG_BLOCK_RE
+
+SEARCH_FIELDS = ("source", "translated")
+INDEX_VERSION = 3
+# над този дял променени редове (delta postings) индексът се пресъздава
+REBUILD_RATIO = 0.1
+
+# regex метасимволи, които прекъсват литерален run
+_REGEX_META = set(".^$*+?{}[]()|\\")
+_QUANTIFIERS = set("*?{")
+# inline флагове: (?x) / (?ix:...) ; допускаме само i (индексът е case-insensitive)
+_INLINE_FLAGS_RE = re.compile(r"\(\?([aiLmsux-]+)[:)]")
+
+
+def trigrams(text: str) -> set[str]:
+    s = text.lower()
+    return {s[i:i+3] for i in range(len(s) - 2)}
+
+
+def index_path_for(master_path: Path) -> Path:
+    # един индекс за всички езици: 02_master/master.trigram.sqlite
+    return master_path.with_name(f"{master_path.stem}.trigram.sqlite")
+
+
+def text_column(field: str, lang: str = "") -> str:
+    # "source" -> source; "translated" -> translated / translated_<lang>
+    return field if field == "source" else work_columns(lang)[0]
+
+
+def indexed_columns(header: list[str]) -> list[str]:
+    return ["source"] + [c for c in header if c == "translated" or c.startswith("translated_")]
+
+
+@dataclass
+class SearchHit:
+    row: int
+    file: str
+    key: str
+    field: str
+    text: str
+
+
+@dataclass
+class MasterRow:
+    row: int
+    offset: int  # байтов offset на реда в master.tsv
+    file: str
+    key: str
+    texts: list[str]  # по indexed_columns()
+    digest: bytes  # 8-байтов hash на целия запис
+
+
+def _record_reader(f) -> Iterator[tuple[int, list[str]]]:
+    # csv над бинарния файл, като пазим offset-а на началото на всеки запис
+    pos = 0
+
+    def lines() -> Iterator[str]:
+        nonlocal pos
+        for raw in f:
+            pos += len(raw)
+            yield raw.decode("utf-8")
+
+    reader = csv.reader(lines(), delimiter="\t")
+    while True:
+        start = pos
+        try:
+            rec = next(reader)
+        except StopIteration:
+            return
+        yield start, rec
+
+
+class _Layout:
+    def __init__(self, header: list[str]):
+        pos = {c: i for i, c in enumerate(header)}
+        self.columns = indexed_columns(header)
+        self.i_file = pos.get("file", 0)
+        self.i_key = pos.get("key", 1)
+        self.i_texts = [pos[c] for c in self.columns if c in pos]
+
+    def row(self, row: int, offset: int, rec: list[str]) -> MasterRow:
+        n = len(rec)
+        digest = hashlib.blake2b("\x1f".join(rec).encode("utf-8"), digest_size=8).digest()
+        return MasterRow(row, offset,
+                         rec[self.i_file] if self.i_file < n else "",
+                         rec[self.i_key] if self.i_key < n else "",
+                         [rec[i] if i < n else "" for i in self.i_texts], digest)
+
+
+def master_columns(master_path: Path) -> list[str]:
+    with master_path.open("rb") as f:
+        _, header = next(_record_reader(f), (0, []))
+    return indexed_columns(header)
+
+
+def scan_master_rows(master_path: Path) -> Iterator[MasterRow]:
+    with master_path.open("rb") as f:
+        records = _record_reader(f)
+        _, header = next(records, (0, []))
+        layout = _Layout(header)
+        for row, (offset, rec) in enumerate(records):
+            yield layout.row(row, offset, rec)
+
+
+def read_master_rows(master_path: Path, offsets: list[tuple[int, int]]) -> Iterator[MasterRow]:
+    """Read only the given (row, offset) records from master, via seek."""
+    with master_path.open("rb") as f:
+        _, header = next(_record_reader(f), (0, []))
+        layout = _Layout(header)
+        for row, offset in offsets:
+            f.seek(offset)
+            lines = (f.readline().decode("utf-8") for _ in itertools.count())
+            yield layout.row(row, offset, next(csv.reader(lines, delimiter="\t")))
+
+
+def _pack(rows: array) -> bytes:
+    # rows са възходящи: първия ред + разликите в най-тесния тип (1/2/4 байта), после zlib
+    deltas = array("I", map(sub, rows[1:], rows[:-1]))
+    code = "B" if not deltas or max(deltas) < 1 << 8 else "H" if max(deltas) < 1 << 16 else "I"
+    packed = deltas if code == "I" else array(code, deltas)
+    return code.encode("ascii") + rows[:1].tobytes() + zlib.compress(packed.tobytes(), 6)
+
+
+def _unpack(blob: bytes) -> array:
+    first = array("I", blob[1:5])
+    deltas = array(blob[:1].decode("ascii"), zlib.decompress(blob[5:]))
+    return array("I", accumulate(deltas, initial=first[0]))
+
+
+class _Postings(dict):
+    def __missing__(self, gram: str) -> array:
+        a = self[gram] = array("I")
+        return a
+
+
+class TrigramIndex:
+    """Persistent trigram index over a master (sqlite), shared by all languages.
+
+    Fields are `source` plus every `translated`/`translated_<lang>` column. Per row
+    only the byte offset and an 8-byte hash of the record are stored; base postings
+    are delta-encoded, zlib-compressed row lists. Rows changed by a merge/replace go
+    into a small append-only `delta` table (old trigrams are not removed, candidates
+    are always verified); rebuild() folds them back once too many rows are stale.
+    """
+
+    def __init__(self, path: Path, master_path: Path):
+        self.path = path
+        self.master_path = master_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS rows (row INTEGER PRIMARY KEY, offset INTEGER, digest BLOB);
+            -- rowid таблица: големите blob-ове в WITHOUT ROWID заемат ~2x място
+            CREATE TABLE IF NOT EXISTS postings (field INTEGER, gram TEXT, rows BLOB,
+                                                 UNIQUE (field, gram));
+            CREATE TABLE IF NOT EXISTS delta (field INTEGER, gram TEXT, row INTEGER);
+            CREATE INDEX IF NOT EXISTS delta_gram ON delta (field, gram);
+        """)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self) -> "TrigramIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _meta(self, name: str) -> str | None:
+        r = self.db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return r[0] if r else None
+
+    def _stamp(self) -> str:
+        st = self.master_path.stat()
+        return f"{st.st_mtime_ns}:{st.st_size}"
+
+    def columns(self) -> list[str]:
+        return json.loads(self._meta("columns") or "[]")
+
+    def _compatible(self) -> bool:
+        return (self._meta("version") == str(INDEX_VERSION)
+                and self.columns() == master_columns(self.master_path))
+
+    def is_fresh(self) -> bool:
+        return self._meta("master") == self._stamp() and self._compatible()
+
+    def row_count(self) -> int:
+        return int(self._meta("rows") or 0)
+
+    def rebuild(self) -> None:
+        columns = master_columns(self.master_path)
+        postings = [_Postings() for _ in columns]
+        rows = []
+        for r in scan_master_rows(self.master_path):
+            rows.append((r.row, r.offset, r.digest))
+            for post, text in zip(postings, r.texts):
+                # редовете идват възходящо -> append в array('I'), без set-ове;
+                # цикълът е изцяло в C (append връща None, any() изчерпва map-а)
+                any(map(array.append, map(post.__getitem__, trigrams(text)), repeat(r.row)))
+
+        with self.db:
+            self.db.execute("DELETE FROM rows")
+            self.db.execute("DELETE FROM postings")
+            self.db.execute("DELETE FROM delta")
+            self.db.executemany("INSERT INTO rows VALUES (?, ?, ?)", rows)
+            self.db.executemany("INSERT INTO postings VALUES (?, ?, ?)",
+                                ((fld, tg, _pack(rs)) for fld, post in enumerate(postings)
+                                 for tg, rs in post.items()))
+            self._write_meta(columns, len(rows), stale=0)
+        self.db.execute("VACUUM")
+
+    def _write_meta(self, columns: list[str], rows: int, stale: int) -> None:
+        self.db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [
+            ("version", str(INDEX_VERSION)), ("columns", json.dumps(columns)),
+            ("master", self._stamp()), ("rows", str(rows)), ("stale", str(stale)),
+        ])
+
+    def refresh(self) -> int:
+        """Catch up with a rewritten master in one pass; returns changed rows.
+
+        Only changed rows are (re)indexed, into the delta table.
+        """
+        if not self._compatible():
+            self.rebuild()
+            return self.row_count()
+
+        old = dict(self.db.execute("SELECT row, digest FROM rows"))
+        rows = []
+        delta = []
+        for r in scan_master_rows(self.master_path):
+            rows.append((r.row, r.offset, r.digest))
+            if old.get(r.row) == r.digest:
+                continue
+            for fld, text in enumerate(r.texts):
+                delta.extend((fld, tg, r.row) for tg in trigrams(text))
+        changed = len({row for _, _, row in delta})
+
+        stale = int(self._meta("stale") or 0) + changed
+        if stale > max(1, len(rows)) * REBUILD_RATIO:
+            self.rebuild()
+            return changed
+
+        with self.db:
+            self.db.execute("DELETE FROM rows")
+            self.db.executemany("INSERT INTO rows VALUES (?, ?, ?)", rows)
+            self.db.executemany("INSERT INTO delta VALUES (?, ?, ?)", delta)
+            self._write_meta(self.columns(), len(rows), stale)
+        return changed
+
+    def candidates(self, column: str, literals: list[str]) -> set[int] | None:
+        """Rows that may contain every trigram of every literal; None = no filter possible."""
+        grams: set[str] = set()
+        for lit in literals:
+            grams |= trigrams(lit)
+        if not grams:
+            return None
+        fld = self.columns().index(column)
+        lists = []
+        for tg in grams:
+            r = self.db.execute("SELECT rows FROM postings WHERE field = ? AND gram = ?",
+                                (fld, tg)).fetchone()
+            rows = set(_unpack(r[0])) if r is not None else set()
+            # OR с delta postings от merge/replace след последния rebuild
+            rows.update(x for (x,) in self.db.execute(
+                "SELECT row FROM delta WHERE field = ? AND gram = ?", (fld, tg)))
+            if not rows:
+                return set()
+            lists.append(rows)
+        # започваме от най-късия posting list
+        lists.sort(key=len)
+        result = lists[0]
+        for rs in lists[1:]:
+            result &= rs
+            if not result:
+                break
+        n = self.row_count()
+        return {r for r in result if r < n}
+
+    def offsets(self, rows: list[int]) -> list[tuple[int, int]]:
+        out = []
+        for i in range(0, len(rows), 500):
+            part = rows[i:i+500]
+            q = f"SELECT row, offset FROM rows WHERE row IN ({','.join('?' * len(part))})"
+            out.extend(self.db.execute(q, part))
+        out.sort()
+        return out
+
+
+def open_index(master_path: Path) -> TrigramIndex:
+    """Open the index for `master_path`; rebuilt only if master changed outside the tool."""
+    idx = TrigramIndex(index_path_for(master_path), master_path)
+    if not idx.is_fresh():
+        idx.rebuild()
+    return idx
+
+
+def refresh_index(master_path: Path) -> int:
+    """Incremental update after master was rewritten (merge/replace), for all languages.
+
+    Does nothing if no index was built yet for this master.
+    """
+    path = index_path_for(master_path)
+    if not path.exists():
+        return 0
+    with TrigramIndex(path, master_path) as idx:
+        return idx.refresh()
+
+
+def _skip_escape(pattern: str, i: int) -> int:
+    """Index just past the escape sequence starting at pattern[i] == '\\'."""
+    j = i + 1
+    if j >= len(pattern):
+        return j
+    c = pattern[j]
+    if c == "x":
+        return j + 3
+    if c == "u":
+        return j + 5
+    if c == "U":
+        return j + 9
+    if c == "N":
+        close = pattern.find("}", j)
+        return close + 1 if close != -1 else len(pattern)
+    if c.isdigit():
+        # octal (\0.., \123) или backreference (\1..\99)
+        k = j + 1
+        if c == "0" or pattern[j:j+3].isdigit() and all(ch in "01234567" for ch in pattern[j:j+3]):
+            while k < len(pattern) and k < j + 3 and pattern[k] in "01234567":
+                k += 1
+        elif k < len(pattern) and pattern[k].isdigit():
+            k += 1
+        return k
+    return j + 1
+
+
+def regex_literals(pattern: str) -> list[str]:
+    """Literal runs that any match of `pattern` must contain.
+
+    Conservative: alternation or inline flags other than `i` -> no literals
+    (full scan); groups, character classes and escapes like \\w, \\x41 are skipped.
+    """
+    if "|" in pattern:
+        return []
+    for flags in _INLINE_FLAGS_RE.findall(pattern):
+        if set(flags) - {"i", "-"}:
+            return []
+    out: list[str] = []
+    run: list[str] = []
+    depth = 0
+    i = 0
+
+    def flush() -> None:
+        if run:
+            out.append("".join(run))
+            run.clear()
+
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\" and i + 1 < len(pattern):
+            nxt = pattern[i + 1]
+            if depth == 0 and not nxt.isalnum():
+                run.append(nxt)
+                i += 2
+            else:
+                flush()
+                i = _skip_escape(pattern, i)
+            continue
+        if ch == "[":
+            flush()
+            # прескачаме до затварящата ']'
+            j = i + 1
+            if j < len(pattern) and pattern[j] == "^":
+                j += 1
+            if j < len(pattern) and pattern[j] == "]":
+                j += 1
+            while j < len(pattern) and pattern[j] != "]":
+                j += 2 if pattern[j] == "\\" else 1
+            i = j + 1
+            continue
+        if ch in _QUANTIFIERS:
+            # предишният символ е optional
+            if run:
+                run.pop()
+            flush()
+            if ch == "{":
+                # {m,n} не е литерал
+                close = pattern.find("}", i)
+                i = close + 1 if close != -1 else len(pattern)
+                continue
+        elif ch == "(":
+            flush()
+            depth += 1
+        elif ch == ")":
+            depth = max(0, depth - 1)
+        elif ch in _REGEX_META:
+            flush()
+        elif depth == 0:
+            run.append(ch)
+        i += 1
+    flush()
+    return out
+
+
+def compile_query(query: str, regex: bool = False, case_sensitive: bool = False) -> re.Pattern[str]:
+    flags = 0 if case_sensitive else re.IGNORECASE
+    return re.compile(query if regex else re.escape(query), flags)
+
+
+def _query_literals(query: str, regex: bool) -> list[str]:
+    return regex_literals(query) if regex else [query]
+
+
+def search_entries(entries: list[Entry], idx: TrigramIndex, query: str,
+                   fields: tuple[str, ...] = SEARCH_FIELDS, regex: bool = False,
+                   case_sensitive: bool = False, lang: str = "") -> list[SearchHit]:
+    """Search rows already loaded in memory, using the index only as a prefilter."""
+    rx = compile_query(query, regex, case_sensitive)
+    literals = _query_literals(query, regex)
+    hits: list[SearchHit] = []
+    for fld in fields:
+        cand = idx.candidates(text_column(fld, lang), literals)
+        rows = range(len(entries)) if cand is None else sorted(r for r in cand if r < len(entries))
+        for row in rows:
+            e = entries[row]
+            text = getattr(e, fld)
+            if rx.search(text):
+                hits.append(SearchHit(row, e.file, e.key, fld, text))
+    return hits
+
+
+def search_master(master_path: Path, query: str, fields: tuple[str, ...] = SEARCH_FIELDS,
+                  regex: bool = False, case_sensitive: bool = False, lang: str = "") -> list[SearchHit]:
+    rx = compile_query(query, regex, case_sensitive)
+    literals = _query_literals(query, regex)
+    hits: list[SearchHit] = []
+    with open_index(master_path) as idx:
+        columns = idx.columns()
+        for fld in fields:
+            column = text_column(fld, lang)
+            if column not in columns:
+                raise ValueError(f"language '{lang}' not in master")
+            f = columns.index(column)
+            cand = idx.candidates(column, literals)
+            if cand is None:
+                # няма литерал >= 3 символа -> пълен scan
+                rows = scan_master_rows(master_path)
+            else:
+                # четем само кандидат-редовете (seek по offset)
+                rows = read_master_rows(master_path, idx.offsets(sorted(cand)))
+            for r in rows:
+                if rx.search(r.texts[f]):
+                    hits.append(SearchHit(r.row, r.file, r.key, fld, r.texts[f]))
+    return hits
+
+
+def replace_outside_tags(text: str, rx: re.Pattern[str], repl: str) -> tuple[str, int]:
+    # един sub върху целия текст (^, $, \b и lookaround работят нормално);
+    # съвпадения, които застъпват `~...~` блок, остават непокътнати
+    spans = [m.span() for m in TAG_BLOCK_RE.finditer(text)]
+    starts = [s for s, _ in spans]
+    total = 0
+
+    def sub(m: re.Match[str]) -> str:
+        nonlocal total
+        s, e = m.span()
+        # последният таг, започващ преди края на съвпадението (празно: преди s)
+        i = bisect.bisect_left(starts, e if e > s else s) - 1
+        if i >= 0 and spans[i][1] > s:
+            return m.group(0)
+        total += 1
+        return m.expand(repl)
+
+    return rx.sub(sub, text), total
+
+
+def replace_in_entries(entries: list[Entry], idx: TrigramIndex, query: str, repl: str,
+                       regex: bool = False, case_sensitive: bool = False, lang: str = "") -> tuple[int, int]:
+    """Bulk find/replace in `translated`; returns (rows changed, replacements)."""
+    rx = compile_query(query, regex, case_sensitive)
+    if not regex:
+        # литерален replace: `\` в repl не трябва да се интерпретира
+        repl = repl.replace("\\", "\\\\")
+    rows_changed = 0
+    total = 0
+    for hit in search_entries(entries, idx, query, ("translated",), regex, case_sensitive, lang):
+        e = entries[hit.row]
+        new, n = replace_outside_tags(e.translated, rx, repl)
+        if n and new != e.translated:
+            e.translated = new
+            rows_changed += 1
+            total += n
+    return rows_changed, total
+
+
+def _language_entries(by_lang: dict[str, list[Entry]], lang: str) -> list[Entry]:
+    if lang not in by_lang:
+        raise ValueError(f"language '{lang}' not in master: {', '.join(by_lang)}")
+    return by_lang[lang]
+
+
+def bulk_replace(master_path: Path, query: str, repl: str, regex: bool = False,
+                 case_sensitive: bool = False, backup_dir: Path | None = None,
+                 lang: str = "") -> tuple[int, int, Path | None]:
+    from .pipeline import backup_file
+
+    by_lang = read_master_langs(master_path)
+    entries = _language_entries(by_lang, lang)
+    with open_index(master_path) as idx:
+        rows_changed, total = replace_in_entries(entries, idx, query, repl, regex, case_sensitive, lang)
+    if not rows_changed:
+        return 0, 0, None
+
+    backup_path = None
+    if backup_dir is not None:
+        backup_path = backup_file(master_path, backup_dir)
+
+    write_master_langs(master_path, by_lang)
+    refresh_index(master_path)
+    return rows_changed, total, backup_path
@@ -13,6 +13,13 @@ class AppSettings:
     chunk_size: int = 1000
     separate_global: bool = True
     run_sanity: bool = True
+    check_consistency: bool = False
+    glossary_path: str = "02_master/glossary.tsv"
+    languages: str = ""  # напр. "bg,ro"; празно = master с една колона translated
+    target_lang: str = "bg"  # целеви език за MT при master с една колона translated
+    mt_backend: str = "stub"
+    mt_batch_size: int = 50
+    mt_concurrency: int = 4
 
 def settings_path() -> Path:
     return Path.cwd() / "settings.json"